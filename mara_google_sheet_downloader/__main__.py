@@ -8,14 +8,32 @@ Mainly to be used with mara to import a Google Sheet to a database table.
 """
 
 import click
+import concurrent.futures
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import pathlib
 import sys
 import random
+import tempfile
+import threading
+import typing as t
 
 import time
 import gspread
+from google.auth.transport.requests import AuthorizedSession
+from gspread.utils import absolute_range_name, rowcol_to_a1
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from mara_google_sheet_downloader import config as c
-from .columns_definition import write_rows_as_csv_to_stream
+from .columns_definition import write_rows_as_csv_to_stream, write_rows_as_binary_copy_to_stream, \
+    parse_column_definition, add_on_, COLUMN_DEFINITION_TYPE
+
+T = t.TypeVar('T')
 
 
 @click.command()
@@ -76,6 +94,128 @@ def gs_download_to_csv(spreadsheet_key: str, worksheet_name: str, columns_defini
     if not columns_definition:
         raise RuntimeError("Need a columns_definition")
 
+    # parse once upfront, so a bad definition fails before anything is downloaded
+    cell_definitions = parse_column_definition(columns_definition)
+
+    credentials = _google_sheet_credentials(
+        service_account_private_key_id=service_account_private_key_id,
+        service_account_private_key=service_account_private_key,
+        service_account_client_email=service_account_client_email,
+        service_account_client_id=service_account_client_id,
+        user_account_client_id=user_account_client_id,
+        user_account_client_secret=user_account_client_secret,
+        user_account_refresh_token=user_account_refresh_token)
+
+    client = _authorized_client(credentials)
+    with _buffered_stdout() as stream:
+        nrows = _download_to_stream(client, spreadsheet_key, worksheet_name, cell_definitions, stream,
+                                    skip_rows=skip_rows, delimiter_char=delimiter_char)
+
+    _cache_token(credentials)
+
+    if fail_on_no_data and nrows == 0:
+        raise ValueError("Received no data rows, failing")
+
+
+def download_many(jobs: t.Iterable[t.Tuple[str, str, COLUMN_DEFINITION_TYPE, t.TextIO]],
+                  credentials=None,
+                  skip_rows: int = 1,
+                  delimiter_char: str = '\t',
+                  max_workers: int = 8) -> t.List[int]:
+    """Downloads several google sheets in parallel, each one as CSV to its own stream
+
+    All downloads share one authorized client, so the connections and the access token are reused. The sheets of
+    each spreadsheet are opened together and their first rows are fetched in one batch request.
+
+    Args:
+        jobs: (spreadsheet_key, worksheet_name, columns_definition, stream) for each sheet
+        credentials: google-auth credentials, default: the credentials from the config
+        skip_rows: int=1, number of leading rows to skip in each sheet
+        delimiter_char: str (default: '\t'), A character that delimits the output fields.
+        max_workers: int=8, number of sheets which are downloaded at the same time
+
+    Returns:
+        The number of rows written for each job
+    """
+    if credentials is None:
+        credentials = _google_sheet_credentials()
+    client = _authorized_client(credentials)
+    jobs = [(spreadsheet_key, worksheet_name, _cell_definitions(columns_definition), stream)
+            for spreadsheet_key, worksheet_name, columns_definition, stream in jobs]
+
+    # the worksheets of each spreadsheet, in the order of the jobs
+    sheets_by_spreadsheet = {}
+    for spreadsheet_key, worksheet_name, cell_definitions, _ in jobs:
+        sheets_by_spreadsheet.setdefault(spreadsheet_key, []).append(
+            (worksheet_name, _number_of_columns(cell_definitions)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        first_windows = {spreadsheet_key: executor.submit(_first_windows, client, spreadsheet_key, sheets,
+                                                          skip_rows=skip_rows)
+                         for spreadsheet_key, sheets in sheets_by_spreadsheet.items()}
+        first_windows = {spreadsheet_key: iter(future.result()) for spreadsheet_key, future in first_windows.items()}
+
+        futures = []
+        for spreadsheet_key, worksheet_name, cell_definitions, stream in jobs:
+            worksheet, first_window = next(first_windows[spreadsheet_key])
+            futures.append(executor.submit(_download_worksheet_to_stream, worksheet, cell_definitions, stream,
+                                           skip_rows=skip_rows, delimiter_char=delimiter_char,
+                                           first_window=first_window))
+        nrows = [future.result() for future in futures]
+
+    _cache_token(credentials)
+    return nrows
+
+
+def _download_to_stream(client: gspread.Client, spreadsheet_key: str, worksheet_name: str,
+                        columns_definition: COLUMN_DEFINITION_TYPE, stream: t.Union[t.TextIO, t.BinaryIO],
+                        skip_rows: int = 1, delimiter_char: str = '\t', binary_copy: bool = False) -> int:
+    """Downloads a google sheet as CSV to the stream and returns the number of written rows
+
+    With binary_copy, the rows are written in PostgreSQL's binary COPY format instead (needs a binary stream).
+    """
+    # Connect to google sheets
+    worksheet = _call_with_retries(lambda: client.open_by_key(spreadsheet_key).worksheet(worksheet_name))
+    return _download_worksheet_to_stream(worksheet, _cell_definitions(columns_definition), stream,
+                                         skip_rows=skip_rows, delimiter_char=delimiter_char, binary_copy=binary_copy)
+
+
+def _download_worksheet_to_stream(worksheet: gspread.Worksheet, cell_definitions: t.List[t.Callable],
+                                  stream: t.Union[t.TextIO, t.BinaryIO], skip_rows: int = 1,
+                                  delimiter_char: str = '\t', binary_copy: bool = False,
+                                  first_window: t.List[t.List[str]] = None) -> int:
+    """Downloads an opened worksheet to the stream and returns the number of written rows"""
+    rows = _iter_worksheet_rows(worksheet, skip_rows=skip_rows, number_of_columns=_number_of_columns(cell_definitions),
+                                first_window=first_window)
+
+    if binary_copy:
+        return write_rows_as_binary_copy_to_stream(rows, columns_definition=cell_definitions, stream=stream)
+    return write_rows_as_csv_to_stream(rows,
+                                       columns_definition=cell_definitions,
+                                       stream=stream,
+                                       delimiter_char=delimiter_char)
+
+
+def _cell_definitions(columns_definition: COLUMN_DEFINITION_TYPE) -> t.List[t.Callable]:
+    if isinstance(columns_definition, str):
+        return parse_column_definition(columns_definition)
+    return columns_definition
+
+
+def _number_of_columns(cell_definitions: t.List[t.Callable]) -> int:
+    """The number of columns to request: only the ones which are actually used (at least one to see empty rows)"""
+    return max(1, sum(1 for cell in cell_definitions if not isinstance(cell, add_on_)))
+
+
+def _google_sheet_credentials(service_account_private_key_id: str = None,
+                              service_account_private_key: str = None,
+                              service_account_client_email: str = None,
+                              service_account_client_id: str = None,
+                              user_account_client_id: str = None,
+                              user_account_client_secret: str = None,
+                              user_account_refresh_token: str = None):
+    """Returns the credentials for either the user account or the service account"""
+
     # TODO: make sure we only get a single credential config overall and warn/abort if we have more than one
     #       (warn: no print to stdout allowed!)
 
@@ -90,13 +230,13 @@ def gs_download_to_csv(spreadsheet_key: str, worksheet_name: str, columns_defini
     user_account_refresh_token = user_account_refresh_token or c.gs_user_account_refresh_token()
 
     if user_account_client_id:
-        credentials = _google_sheet_credentials_from_user_credentials(
+        return _google_sheet_credentials_from_user_credentials(
             client_id=user_account_client_id,
             client_secret=user_account_client_secret,
             refresh_token=user_account_refresh_token,
         )
     elif service_account_client_id:
-        credentials = _google_sheet_credentials_from_service_account_credentials(
+        return _google_sheet_credentials_from_service_account_credentials(
             private_key_id=service_account_private_key_id,
             private_key=service_account_private_key,
             client_email=service_account_client_email,
@@ -105,67 +245,210 @@ def gs_download_to_csv(spreadsheet_key: str, worksheet_name: str, columns_defini
     else:
         raise RuntimeError("Need either credentials for a google user account or for a google service account")
 
+
+# number of rows fetched with one request, this bounds the memory needed for big sheets
+ROWS_PER_REQUEST = 5000
+
+# bytes collected before the csv is written to stdout
+STDOUT_BUFFER_SIZE = 1 << 20
+
+
+@contextlib.contextmanager
+def _buffered_stdout(buffer_size: int = STDOUT_BUFFER_SIZE) -> t.Iterator[t.TextIO]:
+    """Yields a text stream to stdout with a big buffer, so big sheets need fewer write calls"""
+    sys.stdout.flush()
+    stream = _text_stream(sys.stdout.buffer, encoding=sys.stdout.encoding, buffer_size=buffer_size,
+                          errors=sys.stdout.errors)
+    try:
+        yield stream
+    finally:
+        stream.flush()
+        # detach the wrappers, so they don't close stdout when they get garbage collected
+        stream.detach().detach()
+
+
+def _text_stream(raw: t.BinaryIO, encoding: str, buffer_size: int, binary: bool = False,
+                 errors: str = None) -> t.Union[t.TextIO, t.BinaryIO]:
+    """Wraps a binary stream into a buffer of `buffer_size` bytes and (unless `binary`) a text stream for the rows"""
+    stream = io.BufferedWriter(raw, buffer_size=buffer_size)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, errors=errors,
+                            # the csv writer already writes the line endings
+                            newline='')
+
+
+def _iter_worksheet_rows(worksheet: gspread.Worksheet, skip_rows: int, number_of_columns: int = None,
+                         rows_per_request: int = ROWS_PER_REQUEST,
+                         first_window: t.List[t.List[str]] = None) -> t.Iterator[t.List[str]]:
+    """Yields all rows of a worksheet after the skipped header rows
+
+    The rows are fetched window by window, so only a few windows of `rows_per_request` rows are held in memory at
+    any time. The next window is already requested in a background thread while the rows of the current one are
+    written, so the download overlaps with the formatting and writing of the rows.
+
+    Only the first `number_of_columns` columns are requested (default: all) and each row is padded to that width.
+    If the rows of the first window were already fetched (e.g. in a batch request), they can be passed in.
+    """
+    number_of_columns = number_of_columns or worksheet.col_count
+
+    def get_values(range_name: str) -> t.List[t.List[str]]:
+        return _call_with_retries(lambda: worksheet.get_values(range_name))
+
+    def fetch(n: int, range_name: str) -> concurrent.futures.Future:
+        if n == 0 and first_window is not None:
+            future = concurrent.futures.Future()
+            future.set_result(first_window)
+            return future
+        return executor.submit(get_values, range_name)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        windows = (fetch(n, range_name) for n, range_name
+                   in enumerate(_window_ranges(worksheet, skip_rows, number_of_columns, rows_per_request)))
+        next_window = next(windows, None)
+        is_first_window = True
+        while next_window is not None:
+            rows = next_window.result()
+            # prefetch the next window while the rows of this one are consumed
+            next_window = next(windows, None)
+            if is_first_window:
+                # google omits trailing empty rows, so a short first window means the header rows are not all there
+                if len(rows) < skip_rows:
+                    raise ValueError(f"Expected {skip_rows} header rows, but not all were there.")
+                # just drop the rows without outputting them!
+                rows = rows[skip_rows:]
+                is_first_window = False
+            for row in rows:
+                # google also omits trailing empty columns
+                if len(row) < number_of_columns:
+                    row = row + [''] * (number_of_columns - len(row))
+                yield row
+
+
+def _window_ranges(worksheet: gspread.Worksheet, skip_rows: int, number_of_columns: int,
+                   rows_per_request: int = ROWS_PER_REQUEST) -> t.Iterator[str]:
+    """Yields the A1 ranges of the windows in which the rows of a worksheet are requested"""
+    # requesting a range outside of the grid fails, columns beyond it are empty anyway
+    number_of_columns = min(number_of_columns, worksheet.col_count)
+    first_row = 1
+    # the first window also contains the rows which should be skipped
+    last_row = skip_rows + rows_per_request
+    while first_row <= worksheet.row_count:
+        last_row = min(last_row, worksheet.row_count)
+        yield f'{rowcol_to_a1(first_row, 1)}:{rowcol_to_a1(last_row, number_of_columns)}'
+        first_row = last_row + 1
+        last_row += rows_per_request
+
+
+def _first_windows(client: gspread.Client, spreadsheet_key: str, sheets: t.List[t.Tuple[str, int]],
+                   skip_rows: int = 1, rows_per_request: int = ROWS_PER_REQUEST
+                   ) -> t.List[t.Tuple[gspread.Worksheet, t.List[t.List[str]]]]:
+    """Opens several worksheets of a spreadsheet and fetches the first window of rows of each in one request
+
+    Args:
+        sheets: (worksheet_name, number of requested columns) for each worksheet
+
+    Returns:
+        (worksheet, rows of the first window) for each of the sheets
+    """
+    spreadsheet = _call_with_retries(lambda: client.open_by_key(spreadsheet_key))
+    worksheets = {worksheet.title: worksheet for worksheet in _call_with_retries(spreadsheet.worksheets)}
+    for worksheet_name, _ in sheets:
+        if worksheet_name not in worksheets:
+            raise gspread.WorksheetNotFound(worksheet_name)
+
+    ranges = [absolute_range_name(worksheet_name,
+                                  next(_window_ranges(worksheets[worksheet_name], skip_rows, number_of_columns,
+                                                      rows_per_request), None))
+              for worksheet_name, number_of_columns in sheets]
+    value_ranges = _call_with_retries(lambda: spreadsheet.values_batch_get(ranges))['valueRanges']
+    # google omits the values of empty ranges, worksheet.get_values() returns [[]] for them
+    return [(worksheets[worksheet_name], value_range.get('values', [[]]))
+            for (worksheet_name, _), value_range in zip(sheets, value_ranges)]
+
+
+# 429: too many requests, 5xx: temporary problems on google's side
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def _authorized_client(credentials) -> gspread.Client:
+    """Returns a gspread client whose HTTP session already retries temporary errors of the Google API
+
+    Retrying in the transport keeps the (authorized) connections open instead of starting all over again.
+    """
+    session = AuthorizedSession(credentials)
+    retry = Retry(total=5, backoff_factor=1.0, status_forcelist=RETRYABLE_STATUS_CODES,
+                  respect_retry_after_header=True,
+                  # return the last response, so that gspread raises an APIError with the details
+                  raise_on_status=False)
+    session.mount('https://', HTTPAdapter(max_retries=retry))
+    return gspread.Client(auth=credentials, session=session)
+
+
+def _call_with_retries(f: t.Callable[[], T]) -> T:
+    """Calls f and retries in case of (potentially) temporary problems with the Google API
+
+    Temporary API errors are already retried in the HTTP session (see _authorized_client()), so this
+    only sees them when they persist for a longer time, e.g. when the quota is used up for a while.
+    """
     overall_tries = 0
+    rate_limit_errors = 0
     api_errors = 0
     while True:
         try:
-            # Connect to google sheets
-            client = gspread.authorize(credentials)
-            spreadsheet = client.open_by_key(spreadsheet_key)
-            worksheet = spreadsheet.worksheet(worksheet_name)
-            rows = iter(worksheet.get_all_values())
-
-            for _ in range(skip_rows):
-                # just pop the rows without outputting them!
-                try:
-                    next(rows)
-                except StopIteration:
-                    raise ValueError(f"Expected {skip_rows} header rows, but not all were there.")
-            break
+            return f()
         except gspread.exceptions.APIError as apie:
-            # these happen when the API got too many requests with this credentials in 100 seconds
-            # 10 times might be a bit much but this is better than failing just because you have a lot of
-            # gs downloads or some local dev loads at the same time
-            # if it has a NOT_FOUND in it it's something else...
             # apie.response is a response object...
-            if apie.response.status_code in (404,):
-                # 404: the spreadsheet doesn't exist
+            status_code = apie.response.status_code
+            if status_code not in RETRYABLE_STATUS_CODES:
+                # e.g. 404: the spreadsheet doesn't exist, 403: no permission -> retrying won't help
                 print(f'Aborting: {apie!r}', file=sys.stderr, flush=True)
                 raise apie
-            if api_errors > 10:
-                raise apie
-            api_errors += 1
-            print(f'Got API Error, but will retry again: {apie!r}', file=sys.stderr, flush=True)
-            # google measures activity in a 100s window, so wait a bit more on average
-            # add a bit of random to get multiple parallel downloads spread out a bit
-            sleep_seconds = 80 + (80 * random.random())
+            if status_code == 429:
+                # these happen when the API got too many requests with this credentials in a quota window
+                # 10 times might be a bit much but this is better than failing just because you have a lot of
+                # gs downloads or some local dev loads at the same time
+                if rate_limit_errors > 10:
+                    raise apie
+                sleep_seconds = _retry_after(apie.response) or _backoff(rate_limit_errors)
+                rate_limit_errors += 1
+            else:
+                if api_errors > 10:
+                    raise apie
+                sleep_seconds = _backoff(api_errors)
+                api_errors += 1
+            print(f'Got API Error, but will retry again in {sleep_seconds:.0f}s: {apie!r}',
+                  file=sys.stderr, flush=True)
         except Exception as e:
             # some API down or so -> wait a bit and try again
             if overall_tries > 3:
                 raise e
-            print(f'Got exception, but will retry again: {e!r}', file=sys.stderr, flush=True)
+            sleep_seconds = _backoff(overall_tries)
             overall_tries += 1
-            sleep_seconds = 20 * (overall_tries + 1)
+            print(f'Got exception, but will retry again in {sleep_seconds:.0f}s: {e!r}', file=sys.stderr, flush=True)
         time.sleep(sleep_seconds)
-        continue
 
-    stream = sys.stdout
-    nrows = write_rows_as_csv_to_stream(rows,
-                                        columns_definition=columns_definition,
-                                        stream=stream,
-                                        delimiter_char=delimiter_char)
-    stream.flush()
 
-    if fail_on_no_data and nrows == 0:
-        raise ValueError("Received no data rows, failing")
+def _backoff(attempt: int, base: float = 1.0, cap: float = 30.0, jitter: float = 0.5) -> float:
+    """Returns the seconds to wait before the next attempt: exponential backoff with a bit of random on top
+    to get multiple parallel downloads spread out a bit"""
+    return min(cap, base * (2 ** attempt)) * (1 + random.random() * jitter)
+
+
+def _retry_after(response) -> t.Optional[float]:
+    """Returns the seconds the server asked us to wait (Retry-After header) or None if not given"""
+    try:
+        # can also be a http date, which google does not send -> fall back to our own backoff
+        return float(response.headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return None
 
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly', 'https://www.googleapis.com/auth/drive.readonly']
+GOOGLE_TOKEN_URI = 'https://oauth2.googleapis.com/token'
 
 
-# The next version of gspread will probably support google_auth_oauthlib instead of oauth2client but will
-# still support the old credentials: https://github.com/burnash/gspread/pull/711
-# but lets keep this functions private for now
+# lets keep this functions private for now
 def _google_sheet_credentials_from_service_account_credentials(
     private_key_id: str,
     private_key: str,
@@ -174,33 +457,29 @@ def _google_sheet_credentials_from_service_account_credentials(
 ):
     '''Returns the credentials for a service account
 
-    The credentials have the scope set to ['https://spreadsheets.google.com/feeds']
+    The credentials have the scope set to SCOPES. An access token cached by a previous run is reused.
 
     https://gspread.readthedocs.io/en/latest/oauth2.html
 
     '''
-    import oauth2client
-    from oauth2client.service_account import ServiceAccountCredentials
-    from oauth2client import crypt
-
-    # adapted from ServiceAccountCredentials._from_parsed_json_keyfile()
-    service_account_email = client_email
-    private_key_pkcs8_pem = private_key
-    private_key_id = private_key_id
-    client_id = client_id
-    token_uri = oauth2client.GOOGLE_TOKEN_URI
-    revoke_uri = oauth2client.GOOGLE_REVOKE_URI
-
-    signer = crypt.Signer.from_string(private_key_pkcs8_pem)
-    credentials = ServiceAccountCredentials(service_account_email, signer, scopes=SCOPES,
-                                            private_key_id=private_key_id,
-                                            client_id=client_id, token_uri=token_uri,
-                                            revoke_uri=revoke_uri)
-    credentials._private_key_pkcs8_pem = private_key_pkcs8_pem
+    from google.oauth2 import service_account
 
+    credentials = service_account.Credentials(_rsa_signer(private_key, private_key_id),
+                                              service_account_email=client_email,
+                                              token_uri=GOOGLE_TOKEN_URI,
+                                              scopes=SCOPES)
+    _restore_cached_token(credentials)
     return credentials
 
 
+@functools.lru_cache(maxsize=4)
+def _rsa_signer(private_key: str, private_key_id: str):
+    """Returns the signer for a service account private key, the key is only parsed once per process"""
+    from google.auth import crypt
+
+    return crypt.RSASigner.from_string(private_key, private_key_id)
+
+
 def _google_sheet_credentials_from_user_credentials(
     client_id: str,
     client_secret: str,
@@ -208,27 +487,79 @@ def _google_sheet_credentials_from_user_credentials(
 ):
     '''Returns the credentials from user authenticated client_id, client_secret, refresh_token
 
-    The credentials need to have the scope set to ['https://spreadsheets.google.com/feeds']
+    The credentials need to have the scope set to SCOPES
 
     See https://developers.google.com/sheets/api/quickstart/python for how to get such credentials including the
     initial refresh token
     '''
-    # https://stackoverflow.com/a/42230541/1380673
-    import oauth2client
-    import oauth2client.client as client
-
-    credentials = client.OAuth2Credentials(
-        access_token=None,  # set access_token to None since we use a refresh token
-        client_id=client_id,
-        client_secret=client_secret,
-        refresh_token=refresh_token,
-        token_expiry=None,
-        token_uri=oauth2client.GOOGLE_TOKEN_URI,
-        user_agent=None,
-        revoke_uri=oauth2client.GOOGLE_REVOKE_URI,
-        scopes=SCOPES)
+    from google.oauth2.credentials import Credentials
+
+    # no access token since we use a refresh token
+    credentials = Credentials(token=None,
+                              refresh_token=refresh_token,
+                              client_id=client_id,
+                              client_secret=client_secret,
+                              token_uri=GOOGLE_TOKEN_URI,
+                              scopes=SCOPES)
     return credentials
 
 
+def _token_cache_file() -> pathlib.Path:
+    """The file in which access tokens of service accounts are cached between runs"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+    return pathlib.Path(cache_dir) / 'mara_gs_token.json'
+
+
+_TOKEN_EXPIRY_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+_token_cache_lock = threading.Lock()
+
+
+def _restore_cached_token(credentials):
+    """Sets the access token of a previous run on service account credentials (if there is one)
+
+    Expired tokens are refreshed as usual, so this only saves the token request while the token is still valid.
+    """
+    try:
+        cached = json.loads(_token_cache_file().read_text())[credentials.service_account_email]
+        credentials.token = cached['token']
+        # google-auth uses naive utc datetimes
+        credentials.expiry = datetime.datetime.strptime(cached['expiry'], _TOKEN_EXPIRY_FORMAT)
+    except (OSError, ValueError, KeyError, TypeError):
+        # no (usable) cache -> request a new token
+        pass
+
+
+def _cache_token(credentials):
+    """Stores the current access token of service account credentials for the next run"""
+    client_email = getattr(credentials, 'service_account_email', None)
+    if not client_email or not credentials.token or not credentials.expiry:
+        return
+    cache_file = _token_cache_file()
+    try:
+        # the downloads of DownloadGoogleSpreadsheets run in threads: don't lose the token of another thread
+        with _token_cache_lock:
+            try:
+                cache = json.loads(cache_file.read_text())
+            except (OSError, ValueError):
+                cache = {}
+            cache[client_email] = {'token': credentials.token,
+                                   'expiry': credentials.expiry.strftime(_TOKEN_EXPIRY_FORMAT)}
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # other processes can write at the same time, so write to a temporary file of our own and move it in
+            # place. mkstemp() creates it only readable by the current user: the token gives access to the sheets
+            fd, tmp_file = tempfile.mkstemp(prefix=f'{cache_file.name}.', dir=str(cache_file.parent))
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(cache, f)
+                os.replace(tmp_file, str(cache_file))
+            except BaseException:
+                os.unlink(tmp_file)
+                raise
+    except OSError as e:
+        # no print to stdout allowed!
+        print(f'Could not cache the access token: {e!r}', file=sys.stderr, flush=True)
+
+
 if __name__ == '__main__':
     gs_download_to_csv(prog_name='mara_google_sheet_downloader')
@@ -22,7 +22,10 @@ between 2 and 4 (including) and any non-numeric chars (0-9,.) are removed prior
 
 import re
 import csv
-from time import strptime, strftime
+import struct
+import copy
+import functools
+import datetime
 import typing as t
 
 __all__ = ['CellDefinition', 'parse_column_definition', 'COLUMN_DEFINITION_TYPE']
@@ -30,6 +33,19 @@ __all__ = ['CellDefinition', 'parse_column_definition', 'COLUMN_DEFINITION_TYPE'
 COLUMN_DEFINITION_TYPE = t.TypeVar('COLUMN_DEFINITION_TYPE', str, t.List[t.Callable[[str], str]])
 
 
+# PostgreSQL's binary COPY format: signature, flags, header extension length / end of data / a NULL field
+_BINARY_COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_BINARY_COPY_TRAILER = struct.pack('>h', -1)
+_NULL_FIELD = struct.pack('>i', -1)
+# packers for the fields (length + value), compiled once instead of parsing the format for each value
+_pack_field_length = struct.Struct('>i').pack
+_pack_bigint_field = struct.Struct('>iq').pack
+_pack_double_field = struct.Struct('>id').pack
+_pack_date_field = struct.Struct('>ii').pack
+_TRUE_FIELD = struct.pack('>i?', 1, True)
+_FALSE_FIELD = struct.pack('>i?', 1, False)
+
+
 class CellDefinition():
     """Base class for cell definitions
 
@@ -68,7 +84,7 @@ class CellDefinition():
     def validate_and_format_value(self, value: t.Optional[str]) -> str:
         """Validates and formats the value so it can be outputted
 
-        Raises a ValueError, if the value doesn't validate
+        Must return a str (it's written out as is). Raises a ValueError, if the value doesn't validate
         """
         raise NotImplementedError("Need to implement the validate_and_format_value method")
 
@@ -79,12 +95,23 @@ class CellDefinition():
         else:
             # None has to go through or the add-on columns will complain..
             stringified_value = str(value) if value is not None else None
-            ret = str(self.validate_and_format_value(stringified_value))
+            ret = self.validate_and_format_value(stringified_value)
         if ret == '' and self.required:
             raise ValueError("Value required, but was empty after validation and formatting")
         else:
             return ret
 
+    def binary_copy_field(self, value: t.Any) -> bytes:
+        """Outputs a validated value as field of PostgreSQL's binary COPY format (length + data) or raises a ValueError
+
+        Empty values are NULL. Per default the formatted value is sent as text.
+        """
+        formatted = self(value)
+        if formatted == '':
+            return _NULL_FIELD
+        data = formatted.encode()
+        return _pack_field_length(len(data)) + data
+
     ### Internal helper methods
 
     def _parse_arguments(self, arguments: t.Optional[str]):
@@ -132,6 +159,15 @@ class str_(CellDefinition):
     """A string/text cell
     """
 
+    def __call__(self, value: t.Any) -> t.Optional[str]:
+        # the common case of a str without going through the generic checks
+        if isinstance(value, str):
+            # strip() returns the same object if there is nothing to strip
+            value = value.strip()
+            if value or not self.required:
+                return value
+        return super().__call__(value)
+
     def validate_and_format_value(self, input: t.Optional[str]) -> str:
         if input is None:
             input = ''
@@ -139,6 +175,7 @@ class str_(CellDefinition):
 
 
 _NUMERIC_REMOVE_NON_NUMERIC_CHARS = re.compile(r'[^0-9,.]')
+_STRIP_NON_NUMERIC = _NUMERIC_REMOVE_NON_NUMERIC_CHARS.sub
 
 
 class NumericCellDefinition(CellDefinition):
@@ -176,32 +213,69 @@ class NumericCellDefinition(CellDefinition):
                 return name, ','
         return name, self.converter(value)
 
+    def finalize_arguments(self):
+        self._thousands_separator = self.thousands_separator or ','
+        if getattr(self, 'ignore_non_numeric', False):
+            self._remove_non_numeric_chars = _STRIP_NON_NUMERIC
+        else:
+            self._remove_non_numeric_chars = None
+
+    def __call__(self, value: t.Any) -> t.Optional[str]:
+        # the common case of a non-empty str without going through the generic checks
+        if isinstance(value, str) and value and not value.isspace():
+            # a formatted number is never empty, so no need to check `required`
+            return str(self.validate_and_convert_value(value))
+        return super().__call__(value)
+
     def validate_and_format_value(self, input: t.Optional[str]) -> str:
         if input is None:
             return ''
-        if getattr(self, 'ignore_non_numeric', False):
-            input = _NUMERIC_REMOVE_NON_NUMERIC_CHARS.sub('', input)
+        return str(self.validate_and_convert_value(input))
 
-        input = input.replace(self.thousands_separator or ',', '')
+    def binary_copy_field(self, value: t.Any) -> bytes:
+        if value is None or isinstance(value, str) and value.strip() == '':
+            # NULL or fails if required
+            return super().binary_copy_field(None)
+        return self.pack_binary_copy_field(self.validate_and_convert_value(str(value)))
+
+    def pack_binary_copy_field(self, val: t.Union[float, int]) -> bytes:
+        raise NotImplementedError("Need to supply a binary packer")
+
+    def validate_and_convert_value(self, input: str) -> t.Union[float, int]:
+        """Validates the value and converts it to a number"""
+        remove_non_numeric_chars = self._remove_non_numeric_chars
+        if remove_non_numeric_chars is not None:
+            input = remove_non_numeric_chars('', input)
+
+        input = input.replace(self._thousands_separator, '')
         # if we still have a comma we have a dot as a thousands separator...
         input = input.replace(',', '.')
         val = self.converter(input)
-        if self.lower is not None:
-            if self.lower > val:
-                raise ValueError(f'value out of range {self.lower}<={val}')
-        if self.upper is not None:
-            if val > self.upper:
-                raise ValueError(f'value out of range {val}<={self.upper}')
-        return str(val)
+        lower, upper = self.lower, self.upper
+        if lower is not None and lower > val:
+            raise ValueError(f'value out of range {lower}<={val}')
+        if upper is not None and val > upper:
+            raise ValueError(f'value out of range {val}<={upper}')
+        return val
 
 
 class int_(NumericCellDefinition):
     def converter(self, input):
         try:
+            # most values are plain integers: parsed exactly (also above 2**53) and without the detour via float
+            return int(input)
+        except ValueError:
+            pass
+        try:
+            # e.g. '1.0' or '1e3'
             return int(float(input))
         except:
             raise ValueError(f'Not parseable as int: {input}')
 
+    def pack_binary_copy_field(self, val: int) -> bytes:
+        # bigint
+        return _pack_bigint_field(8, val)
+
 
 int_.__doc__ = NumericCellDefinition.__doc__.replace('numeric', 'int')
 
@@ -213,6 +287,10 @@ class float_(NumericCellDefinition):
         except:
             raise ValueError(f'Not parseable as float: {input}')
 
+    def pack_binary_copy_field(self, val: float) -> bytes:
+        # double precision
+        return _pack_double_field(8, val)
+
 
 float_.__doc__ = NumericCellDefinition.__doc__.replace('numeric', 'float')
 
@@ -241,8 +319,15 @@ class bool_(CellDefinition):
             self._valid_str_values[getattr(self, 'true').lower()] = True
         if getattr(self, 'false', None):
             self._valid_str_values[getattr(self, 'false').lower()] = False
+        self._true_values = frozenset(v for v, is_true in self._valid_str_values.items() if is_true)
+        self._false_values = frozenset(v for v, is_true in self._valid_str_values.items() if not is_true)
 
     def validate_and_format_value(self, value: t.Optional[str]) -> str:
+        # most values are already lower case, so look them up before lowercasing them
+        if value in self._true_values:
+            return 'True'
+        if value in self._false_values:
+            return 'False'
 
         ## shouldn't be possible
         if isinstance(value, bool):
@@ -260,28 +345,71 @@ class bool_(CellDefinition):
             raise ValueError('invalid literal for boolean. not numeric and not string.')
 
         lower_value = value.lower()
-        try:
-            return str(self._valid_str_values[lower_value])
-        except:
-            raise ValueError('invalid literal for boolean: "%s"' % value)
+        if lower_value in self._true_values:
+            return 'True'
+        if lower_value in self._false_values:
+            return 'False'
+        raise ValueError('invalid literal for boolean: "%s"' % value)
+
+    def binary_copy_field(self, value: t.Any) -> bytes:
+        formatted = self(value)
+        if formatted == '':
+            return _NULL_FIELD
+        return _TRUE_FIELD if formatted == 'True' else _FALSE_FIELD
+
+
+_ISO_DATE_RE = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}')
+_POSTGRES_EPOCH = datetime.date(2000, 1, 1).toordinal()
+# the number of distinct (value, formats) for which the formatted or converted date is kept
+_DATE_CACHE_SIZE = 4096
+
+
+# a date column usually contains the same dates again and again, so each distinct value is only parsed once
+# (strptime is by far the most expensive part of the formatting). Invalid values are not cached.
+@functools.lru_cache(maxsize=_DATE_CACHE_SIZE)
+def _format_date(value: str, in_fmt: str, out_fmt: str) -> str:
+    # the common case: ISO dates in and out, so a valid value can be passed through as is
+    if in_fmt == '%Y-%m-%d' and out_fmt == '%Y-%m-%d' and _ISO_DATE_RE.fullmatch(value):
+        # raises a ValueError for e.g. 2020-02-30
+        datetime.date(int(value[:4]), int(value[5:7]), int(value[8:]))
+        return value
+    return datetime.datetime.strptime(value, in_fmt).strftime(out_fmt)
+
+
+@functools.lru_cache(maxsize=_DATE_CACHE_SIZE)
+def _convert_date(value: str, in_fmt: str) -> datetime.date:
+    if in_fmt == '%Y-%m-%d' and _ISO_DATE_RE.fullmatch(value):
+        return datetime.date(int(value[:4]), int(value[5:7]), int(value[8:]))
+    return datetime.datetime.strptime(value, in_fmt).date()
 
 
 class date_(CellDefinition):
     """A date cell
 
     Args:
-        in_format: str='%Y-%m-%d': format string the input corresponds to (strptime format)
-        out_format: str='%Y-%m-%d': format string the output should corresponds to (strftime format)
+        in_fmt: str='%Y-%m-%d': format string the input corresponds to (strptime format)
+        out_fmt: str='%Y-%m-%d': format string the output should corresponds to (strftime format)
     """
 
     _arguments = ['in_fmt', 'out_fmt']
 
     def init_defaults(self):
-        self.out_format = '%Y-%m-%d'
-        self.in_format = '%Y-%m-%d'
+        self.out_fmt = '%Y-%m-%d'
+        self.in_fmt = '%Y-%m-%d'
 
     def validate_and_format_value(self, value: t.Optional[str]) -> str:
-        return strftime(self.out_format, strptime(value, self.in_format))
+        return _format_date(value, self.in_fmt, self.out_fmt)
+
+    def validate_and_convert_value(self, value: str) -> datetime.date:
+        """Validates the value and converts it to a date"""
+        return _convert_date(value, self.in_fmt)
+
+    def binary_copy_field(self, value: t.Any) -> bytes:
+        if value is None or isinstance(value, str) and value.strip() == '':
+            # NULL or fails if required
+            return super().binary_copy_field('')
+        # date: days since 2000-01-01
+        return _pack_date_field(4, self.validate_and_convert_value(str(value)).toordinal() - _POSTGRES_EPOCH)
 
 
 class add_on_(CellDefinition):
@@ -331,18 +459,25 @@ class counter_(add_on_):
         self.current_count += 1
         return str(self.current_count)
 
+    def binary_copy_field(self, value: t.Any) -> bytes:
+        # bigint
+        return _pack_bigint_field(8, int(self(value)))
+
 
-class _SkipColumn(Exception):
-    pass
+# returned instead of a value by cells whose column should be dropped
+_SKIP = object()
 
 
 class dont_include_(CellDefinition):
     def __call__(self, value: t.Optional[str]):
         # needs to be overwritten to not get the empty str returns of the default implementation
-        raise _SkipColumn()
+        return _SKIP
 
-    def validate_and_format_value(self, value: t.Optional[str]) -> str:
-        raise _SkipColumn()
+    def validate_and_format_value(self, value: t.Optional[str]):
+        return _SKIP
+
+    def binary_copy_field(self, value: t.Any):
+        return _SKIP
 
 
 _CELLS = {
@@ -358,40 +493,97 @@ _CELLS = {
 }  # type: t.Dict[str, t.Callable]
 
 
+# a cell letter, optionally followed by arguments in '()' and/or a '!' for 'required'
+# The order is important: valid stuff is x! and x()!
+_CELL_DEFINITION_RE = re.compile(r'([' + ''.join(re.escape(letter) for letter in _CELLS) + r'])(?:\(([^)]*)\))?(!)?')
+
+
 def parse_column_definition(definition: str) -> t.List[t.Callable]:
     """Returns a list of CellDefinition for a column definition"""
+    # the cell definitions are shared between calls, except the counters which count per use
+    return [copy.copy(cell) if isinstance(cell, counter_) else cell
+            for cell in _parse_column_definition(definition)]
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_column_definition(definition: str) -> t.Tuple[t.Callable, ...]:
+    """Returns the (cached) CellDefinitions for a column definition"""
     res = []
     col = 0
     while col < len(definition):
-        try:
-            cell = _CELLS[definition[col]]
-            col += 1
-        except KeyError:
+        match = _CELL_DEFINITION_RE.match(definition, col)
+        if not match:
             avail = ','.join(_CELLS.keys())
             msg = f"Can't find a cell definition for '{definition[col]}' at pos {col + 1}, available: {avail}"
             raise RuntimeError(msg)
-        args = None
-        required = False
-        # peek if the next is a '(' or '!'
-        # This is not else/elif on purpose and the order is important
-        # valid stuff is x! and x()!
-        if col < len(definition) and definition[col] == '(':
-            # ... and get the stuff until )
-            right = definition.find(')', col + 1)
-            if right == -1:
-                msg = f"Bad column definition: found '(' at pos {col + 1}, but no following ')': {definition}"
-                raise RuntimeError(msg)
-            args = definition[col + 1:right]
-            # swallow the ')'
-            col = right + 1
-        if col < len(definition) and definition[col] == '!':
-            required = True
-            # swallow the '!'
-            col += 1
-
-        cell_instance = cell(unparsed_args=args, required=required)  # type: t.Callable
+        letter, args, required = match.groups()
+        col = match.end()
+        if args is None and required is None and col < len(definition) and definition[col] == '(':
+            msg = f"Bad column definition: found '(' at pos {col + 1}, but no following ')': {definition}"
+            raise RuntimeError(msg)
+
+        cell_instance = _CELLS[letter](unparsed_args=args, required=required is not None)  # type: t.Callable
         res.append(cell_instance)
-    return res
+    return tuple(res)
+
+
+def _column_plan(cell_definitions: t.Sequence[t.Callable]
+                 ) -> t.List[t.Tuple[str, t.Optional[t.Callable], t.Optional[int]]]:
+    """Decides once per column what has to be done for each row, so the row loop doesn't need to check the types
+
+    Returns (op, cell, column number in the row) per cell definition
+    """
+    plan = []
+    col_number = 0
+    for cell in cell_definitions:
+        if isinstance(cell, dont_include_):
+            # value should be dropped
+            plan.append(('skip', None, None))
+            col_number += 1
+        elif isinstance(cell, add_on_):
+            # add-on columns don't consume a value from the row
+            plan.append(('addon', cell, None))
+        else:
+            plan.append(('input', cell, col_number))
+            col_number += 1
+    return plan
+
+
+def _compile_row_formatter(plan: t.List[t.Tuple[str, t.Optional[t.Callable], t.Optional[int]]],
+                           binary_copy: bool = False) -> t.Callable[[t.List[str]], t.Tuple[t.Any, ...]]:
+    """Generates a function which returns the formatted output values for a row
+
+    The function is straight-line code (e.g. `return (c0(row[0]), c1, c2(row[2]), )`) without any loop or
+    dispatch per column. The output is built as a tuple of the (known) output width in one go. This is faster
+    than filling a preallocated list per row: building the tuple is a single bytecode and small tuples are
+    recycled by CPython, so it doesn't put more pressure on the allocator than reusing a list.
+
+    With binary_copy, the values are fields of PostgreSQL's binary COPY format instead of str.
+    """
+    namespace = {}
+    values = []
+    for op, cell, col_number in plan:
+        if op == 'skip':
+            continue
+        name = f'c{len(values)}'
+        format_value = cell.binary_copy_field if binary_copy else cell
+        if op == 'input':
+            values.append(f'{name}(row[{col_number}])')
+        elif isinstance(cell, counter_):
+            # counts up for each row
+            values.append(f'{name}(None)')
+        else:
+            # add-on columns have the same value in every row
+            try:
+                format_value = format_value(None)
+                values.append(name)
+            except ValueError:
+                # e.g. a required add-on column without value -> fail for each row
+                values.append(f'{name}(None)')
+        namespace[name] = format_value
+    source = f"def format_row(row):\n    return ({''.join(value + ', ' for value in values)})\n"
+    exec(source, namespace)
+    return namespace['format_row']
 
 
 def write_rows_as_csv_to_stream(rows: t.Union[t.Sequence[t.List[str]], t.Iterator[t.List[str]]],
@@ -418,40 +610,68 @@ def write_rows_as_csv_to_stream(rows: t.Union[t.Sequence[t.List[str]], t.Iterato
     else:
         cell_definitions = columns_definition
 
-    cell_definitions_for_existing_columns = [f for f in cell_definitions if not isinstance(f, add_on_)]
+    plan = _column_plan(cell_definitions)
+
+    # don't change csv.excel itself, it's shared by all writers (e.g. in other threads)
+    csv_writer = csv.writer(stream, dialect=csv.excel, delimiter=delimiter_char)
 
-    # only the one we want, without addons
-    number_of_columns_to_look_at = len(cell_definitions_for_existing_columns)
+    format_row = _compile_row_formatter(plan)
 
-    dialect = csv.excel
-    dialect.delimiter = delimiter_char
+    n_rows = 0
+
+    def formatted_rows():
+        nonlocal n_rows
+        for row in rows:
+            if any(row):
+                try:
+                    buf = format_row(row)
+                except Exception as e:
+                    raise ValueError(f'Row contains bad data: {row} ({str(e.args)})')
+                n_rows += 1
+                yield buf
+
+    # the loop over the rows runs within the csv module
+    csv_writer.writerows(formatted_rows())
+    return n_rows
+
+
+def write_rows_as_binary_copy_to_stream(rows: t.Union[t.Sequence[t.List[str]], t.Iterator[t.List[str]]],
+                                        columns_definition: COLUMN_DEFINITION_TYPE,
+                                        stream: t.BinaryIO,
+                                        ):
+    """Writes each row (list of strings) in PostgreSQL's binary COPY format to the stream
+
+    The values are sent in the binary representation of the column types, so the table columns must have exactly
+    these types: 's' and '&' -> text, 'i' and 'c' -> bigint, 'f' -> double precision, 'b' -> boolean, 'd' -> date.
+    Empty values are NULL.
+
+    Args:
+        rows: iterable of list of strings, input data
+        columns_definition: either a str with a column definition or a list of CellDefinition instances.
+                            If a row has more values than this definition (minus any add-on/counter columns),
+                            the rest is omitted.
+        stream: t.BinaryIO, sink where the processed content is written to (e.g. a psycopg Copy object)
+    """
+    if isinstance(columns_definition, str):
+        cell_definitions = parse_column_definition(columns_definition)
+    else:
+        cell_definitions = columns_definition
 
-    csv_writer = csv.writer(stream, dialect=dialect)
+    plan = _column_plan(cell_definitions)
+    format_row = _compile_row_formatter(plan, binary_copy=True)
+    # every tuple starts with the number of fields
+    tuple_header = struct.pack('>h', sum(1 for op, _, _ in plan if op != 'skip'))
 
+    write = stream.write
+    write(_BINARY_COPY_HEADER)
     n_rows = 0
     for row in rows:
-        if len(''.join(row)) > 0:
-            buf = []
-            col_number = 0
-            relevant_cols = row[:number_of_columns_to_look_at]
+        if any(row):
             try:
-                for cell in cell_definitions:
-                    # look out for add-on columns!
-                    if not isinstance(cell, add_on_):
-                        x = relevant_cols[col_number]
-                        col_number += 1
-                    else:
-                        x = None
-
-                    try:
-                        val = cell(x)
-                        buf.append(str(val))
-                    except _SkipColumn:
-                        # value should be dropped
-                        pass
+                fields = format_row(row)
             except Exception as e:
                 raise ValueError(f'Row contains bad data: {row} ({str(e.args)})')
-
-            csv_writer.writerow(buf)
+            write(tuple_header + b''.join(fields))
             n_rows += 1
+    write(_BINARY_COPY_TRAILER)
     return n_rows
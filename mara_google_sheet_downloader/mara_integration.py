@@ -1,13 +1,37 @@
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import importlib.util
+import io
+import os
 import shlex
+import shutil
+import subprocess
 import sys
+import tempfile
+import traceback
+import typing as t
 from mara_pipelines import pipelines
 from mara_pipelines.logging import logger
+import mara_db.dbs
 import mara_db.shell
 
 from .columns_definition import COLUMN_DEFINITION_TYPE
 from mara_google_sheet_downloader import config as c
 
-__all__ = ['DownloadGoogleSpreadsheet']
+if t.TYPE_CHECKING:
+    # only for the annotations: imported where needed, psycopg is optional
+    import google.auth.credentials
+    import gspread
+    import psycopg
+
+__all__ = ['DownloadGoogleSpreadsheet', 'DownloadGoogleSpreadsheets']
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+# with truncate_before_load, downloads up to this size are kept in memory before the load, bigger ones on disk
+SPOOL_MAX_MEMORY_SIZE = 16 * 1024 * 1024
 
 
 class DownloadGoogleSpreadsheet(pipelines.Command):
@@ -19,7 +43,10 @@ class DownloadGoogleSpreadsheet(pipelines.Command):
                  target_db_alias: str = 'dwh',
                  skip_rows: int = 1,
                  use_flask_command: bool = False,
-                 fail_on_no_data: bool = False
+                 fail_on_no_data: bool = False,
+                 copy_format: str = 'csv',
+                 copy_buffer_size: int = COPY_BUFFER_SIZE,
+                 truncate_before_load: bool = False
                  ) -> None:
         """
         Downloads a google spreadsheet to a table
@@ -37,10 +64,29 @@ class DownloadGoogleSpreadsheet(pipelines.Command):
             use_flask_command: bool=False, if true uses the downloader via flask, which needs an import to the main
                                module in the app.py import path to make the command available (any print() in that path
                                will fail the download). If True, the credentials needed in the downloader itself are
-                               directly taken from the config, not passed in via commandline arguments.
+                               directly taken from the config, not passed in via commandline arguments. Only applies
+                               to the shell command, which is not used when the sheet is copied in process (a
+                               PostgreSQL db with psycopg 3 or psql).
             fail_on_no_data: bool=True, if true fail on no data rows received
+            copy_format: str='csv', 'binary' sends the rows in PostgreSQL's binary COPY format, which saves parsing
+                         the values in the db. Needs the in-process copy (psycopg 3 or psql and a PostgreSQL db)
+                         and table columns of exactly the matching types: text for 's' and '&', bigint for 'i' and
+                         'c', double precision for 'f', boolean for 'b' and date for 'd'.
+            copy_buffer_size: int=64 KiB, the size of the blocks in which the in-process copy sends the data to
+                              the db. This is (about) the memory the copy needs on top of the downloaded rows. Bigger
+                              blocks mean fewer calls into libpq, but above 64 KiB no speedup was measurable.
+            truncate_before_load: bool=False, if true the table is truncated and loaded in one transaction (only
+                                  PostgreSQL). The rows are then copied with FREEZE: they are written as already
+                                  frozen, which saves vacuum from rewriting each of them later. The truncate locks
+                                  the table against all reads and writes until the commit, so the sheet is
+                                  downloaded and validated first (into a temporary file) and only the copy runs
+                                  under the lock. Not so with the shell command (no psql in the PATH of this
+                                  process), where the table stays locked during the whole download. A concurrent
+                                  long running transaction may see the new rows.
 
         """
+        if copy_format not in ('csv', 'binary'):
+            raise ValueError(f"copy_format must be 'csv' or 'binary', not {copy_format!r}")
         self.spreadsheet_key = spreadsheet_key
         self.worksheet_name = worksheet_name
         self.columns_definition = columns_definition
@@ -50,41 +96,372 @@ class DownloadGoogleSpreadsheet(pipelines.Command):
         self.delimiter_char = '\t'
         self.use_flask_command = use_flask_command
         self.fail_on_no_data = fail_on_no_data
+        self.copy_format = copy_format
+        self.copy_buffer_size = copy_buffer_size
+        self.truncate_before_load = truncate_before_load
+        self._html_doc_items = None
 
     def run(self) -> bool:
         logger.log(
             f'Loading google sheet {self.spreadsheet_key} into {self.target_db_alias}.{self.target_table_name}...')
-        if not super().run():
+        if _can_copy_in_process(self.target_db_alias):
+            success = self._copy_in_process()
+        elif _can_copy_via_psql(self.target_db_alias):
+            success = self._copy_via_psql()
+        elif self.copy_format == 'binary':
+            logger.log('The binary copy format needs psycopg 3 or psql and a PostgreSQL db', is_error=True)
+            success = False
+        elif self.truncate_before_load and not _is_postgresql(self.target_db_alias):
+            logger.log('truncate_before_load is only supported for PostgreSQL dbs', is_error=True)
+            success = False
+        else:
+            success = super().run()
+        if not success:
             logger.log(f'Error while loading google sheet {self.spreadsheet_key}.')
             return False
         logger.log(f'Finished loading google sheet {self.spreadsheet_key}.')
         return True
 
+    def _copy_in_process(self) -> bool:
+        """Downloads the sheet in this process and writes it directly into the db via COPY FROM STDIN
+
+        Saves starting the downloader and psql and piping the data through them. Uses the same
+        csv format as shell_command() unless the binary copy format is requested.
+        """
+        from .__main__ import _cache_token
+
+        try:
+            credentials, client = _google_sheet_client(_credentials_fingerprint())
+            with _postgres_connection(mara_db.dbs.db(self.target_db_alias)) as connection:
+                if self.truncate_before_load:
+                    with self._download_to_temporary_file(client, encoding=connection.info.encoding) \
+                            as (nrows, rows):
+                        if self.fail_on_no_data and nrows == 0:
+                            # before the truncate locks the table
+                            raise ValueError("Received no data rows, failing")
+                        # truncate and copy run in the same transaction
+                        connection.execute(self._truncate_statement())
+                        with connection.cursor() as cursor, cursor.copy(self._copy_statement()) as copy:
+                            for block in iter(functools.partial(rows.read, self.copy_buffer_size), b''):
+                                copy.write(block)
+                else:
+                    with connection.cursor() as cursor, cursor.copy(self._copy_statement()) as copy, \
+                            _buffered_copy_stream(copy, binary=self.copy_format == 'binary',
+                                                  buffer_size=self.copy_buffer_size) as stream:
+                        nrows = self._download_to_stream(client, stream)
+                    if self.fail_on_no_data and nrows == 0:
+                        # rolls back the COPY
+                        raise ValueError("Received no data rows, failing")
+            _cache_token(credentials)
+        except Exception:
+            logger.log(traceback.format_exc(), format=logger.Format.VERBATIM, is_error=True)
+            return False
+        logger.log(f'{nrows} rows copied')
+        return True
+
+    def _copy_via_psql(self) -> bool:
+        """Downloads the sheet in this process and pipes it directly into psql's COPY FROM STDIN
+
+        For when psycopg 3 is not installed: saves starting the downloader and a shell for the pipe
+        between the downloader and psql.
+        """
+        from .__main__ import _cache_token, _text_stream
+
+        statements = [self._copy_statement()]
+        if self.truncate_before_load:
+            statements.insert(0, self._truncate_statement())
+        db = mara_db.dbs.db(self.target_db_alias)
+        try:
+            credentials, client = _google_sheet_client(_credentials_fingerprint())
+            with contextlib.ExitStack() as stack:
+                if self.truncate_before_load:
+                    # psql truncates the table right at its start, before reading any rows
+                    nrows, rows = stack.enter_context(self._download_to_temporary_file(client, encoding='utf-8'))
+                    if self.fail_on_no_data and nrows == 0:
+                        # before psql is started and locks the table
+                        raise ValueError("Received no data rows, failing")
+                # not a pipe: psql would block on a full pipe of errors while we still write the rows
+                stderr = stack.enter_context(tempfile.TemporaryFile())
+                # unbuffered: the stream around it has the buffer
+                process = subprocess.Popen(_psql_command(db, *statements), env=_psql_environment(db),
+                                           stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr,
+                                           bufsize=0)
+                try:
+                    if self.truncate_before_load:
+                        stream = _text_stream(process.stdin, encoding='utf-8', buffer_size=self.copy_buffer_size,
+                                              binary=True)
+                        shutil.copyfileobj(rows, stream, self.copy_buffer_size)
+                    else:
+                        stream = _text_stream(process.stdin, encoding='utf-8', buffer_size=self.copy_buffer_size,
+                                              binary=self.copy_format == 'binary')
+                        nrows = self._download_to_stream(client, stream)
+                        if self.fail_on_no_data and nrows == 0:
+                            raise ValueError("Received no data rows, failing")
+                    # the end of the input finishes the COPY
+                    stream.close()
+                except BrokenPipeError:
+                    # psql stopped reading, the reason is in its error output
+                    pass
+                except BaseException:
+                    # aborts the COPY
+                    process.kill()
+                    process.wait()
+                    raise
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    raise RuntimeError(f'psql failed with exit code {process.returncode}: {stderr.read().decode()}')
+            _cache_token(credentials)
+        except Exception:
+            logger.log(traceback.format_exc(), format=logger.Format.VERBATIM, is_error=True)
+            return False
+        logger.log(f'{nrows} rows copied')
+        return True
+
+    def _copy_statement(self) -> str:
+        options = 'FORMAT binary' if self.copy_format == 'binary' else \
+            "FORMAT csv, DELIMITER '{}', NULL ''".format(self.delimiter_char.replace("'", "''"))
+        if self.truncate_before_load:
+            # needs the truncate in the same transaction
+            options += ', FREEZE'
+        return f'COPY {self.target_table_name} FROM STDIN WITH ({options})'
+
+    def _truncate_statement(self) -> str:
+        return f'TRUNCATE {self.target_table_name}'
+
+    def _download_to_stream(self, client, stream: t.Union[t.TextIO, t.BinaryIO]) -> int:
+        from .__main__ import _download_to_stream
+
+        return _download_to_stream(client, self.spreadsheet_key, self.worksheet_name, self.columns_definition, stream,
+                                   skip_rows=self.skip_rows, delimiter_char=self.delimiter_char,
+                                   binary_copy=self.copy_format == 'binary')
+
+    @contextlib.contextmanager
+    def _download_to_temporary_file(self, client, encoding: str) -> t.Iterator[t.Tuple[int, t.BinaryIO]]:
+        """Downloads the sheet into a temporary file and yields the number of rows and the file, ready for reading
+
+        For truncate_before_load: the truncate locks the table until the commit, so the download (with its retries)
+        and the validation of the values happen before it.
+        """
+        from .__main__ import _text_stream
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_SIZE) as file:
+            stream = _text_stream(_CopyWriter(file), encoding=encoding, buffer_size=self.copy_buffer_size,
+                                  binary=self.copy_format == 'binary')
+            nrows = self._download_to_stream(client, stream)
+            stream.flush()
+            file.seek(0)
+            yield nrows, file
+
     def shell_command(self):
         return (gs_downloader_shell_command(self.spreadsheet_key, self.worksheet_name, self.columns_definition,
                                             skip_rows=self.skip_rows, delimiter_char=self.delimiter_char,
                                             use_flask_command=self.use_flask_command,
                                             fail_on_no_data=self.fail_on_no_data)
                 + f'{_shell_linebreak_escape}| '
-                + mara_db.shell.copy_from_stdin_command(self.target_db_alias, target_table=self.target_table_name,
-                                                        null_value_string='', csv_format=True,
-                                                        delimiter_char=self.delimiter_char))
+                + self._copy_from_stdin_command())
+
+    def _copy_from_stdin_command(self) -> str:
+        if not self.truncate_before_load:
+            return mara_db.shell.copy_from_stdin_command(self.target_db_alias, target_table=self.target_table_name,
+                                                         null_value_string='', csv_format=True,
+                                                         delimiter_char=self.delimiter_char)
+        if not _is_postgresql(self.target_db_alias):
+            # run() doesn't get here
+            raise ValueError('truncate_before_load is only supported for PostgreSQL dbs')
+        # like mara_db.shell.copy_from_stdin_command(), but truncates in the same transaction
+        return (mara_db.shell.query_command(self.target_db_alias)
+                + f'{_shell_linebreak_escape}{_indentions} --single-transaction'
+                + ''.join(f'{_shell_linebreak_escape}{_indentions} --command={_quote(statement)}'
+                          for statement in [self._truncate_statement(), self._copy_statement()]))
+
+    def _loading_path(self) -> str:
+        """How run() loads the sheet, for the docs"""
+        if _can_copy_in_process(self.target_db_alias):
+            return 'in process, COPY via psycopg 3'
+        if _can_copy_via_psql(self.target_db_alias):
+            return 'in process, piped into psql'
+        return _invocation(self.use_flask_command)
 
     def html_doc_items(self) -> [(str, str)]:
+        # the command doesn't change after its creation, so the escaped items are only built once
+        if self._html_doc_items is None:
+            self._html_doc_items = self._build_html_doc_items()
+        return list(self._html_doc_items)
+
+    def _build_html_doc_items(self) -> [(str, str)]:
         from mara_page import _
         from html import escape
         return [
             ('spreadsheet key', _.pre[escape(self.spreadsheet_key)]),
             ('worksheet name', _.pre[escape(self.worksheet_name)]),
-            ('columns definition', _.pre[escape(self.columns_definition)]),
+            ('columns definition', _.pre[escape(str(self.columns_definition))]),
             ('target table name', _.pre[escape(self.target_table_name)]),
             ('target db', _.pre[escape(self.target_db_alias)]),
             ('Number of rows to skip', _.pre[str(self.skip_rows)]),
-            ('Invocation', _.pre[_invocation(self.use_flask_command)]),
+            ('Invocation', _.pre[self._loading_path()]),
             ('Fail on no data', _.pre[str(self.fail_on_no_data)]),
+            ('Copy format', _.pre[self.copy_format]),
+            ('Truncate before load', _.pre[str(self.truncate_before_load)]),
         ]
 
 
+class DownloadGoogleSpreadsheets(pipelines.Command):
+    def __init__(self, sheets: t.List[DownloadGoogleSpreadsheet], max_workers: int = 8) -> None:
+        """
+        Downloads several google spreadsheets in parallel, each to its own table
+
+        Saves waiting for the google API one sheet after the other when there are many (small) sheets, which would
+        happen with one DownloadGoogleSpreadsheet command per sheet in a task.
+
+        Args:
+            sheets: the downloads, each one configured like a single DownloadGoogleSpreadsheet command
+            max_workers: int=8, the maximum number of sheets which are downloaded at the same time
+        """
+        self.sheets = sheets
+        self.max_workers = max_workers
+
+    def run(self) -> bool:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = []
+            for sheet in self.sheets:
+                # for the debug output of the sheet
+                sheet.parent = self.parent
+                # each download uses its own google client and db connection
+                futures.append(executor.submit(sheet.run))
+            for future in concurrent.futures.as_completed(futures):
+                if not future.result():
+                    # fail fast: don't start the downloads which are still waiting
+                    for pending in futures:
+                        pending.cancel()
+                    return False
+        return True
+
+    def html_doc_items(self) -> [(str, str)]:
+        from mara_page import _
+        from html import escape
+        return [
+            ('sheets', _.pre['\n'.join(escape(f'{sheet.spreadsheet_key} / {sheet.worksheet_name} '
+                                                f'-> {sheet.target_db_alias}.{sheet.target_table_name}')
+                                         for sheet in self.sheets)]),
+            ('Max workers', _.pre[str(self.max_workers)]),
+        ]
+
+
+def _credentials_fingerprint() -> str:
+    """A hash of the credentials in the config, so that the clients can be cached without keeping the secrets"""
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for value in [c.gs_service_account_private_key_id(), c.gs_service_account_private_key(),
+                  c.gs_service_account_client_email(), c.gs_service_account_client_id(),
+                  c.gs_user_account_client_id(), c.gs_user_account_client_secret(),
+                  c.gs_user_account_refresh_token()]:
+        fingerprint.update(repr(value).encode() + b'\0')
+    return fingerprint.hexdigest()
+
+
+@functools.lru_cache(maxsize=4)
+def _google_sheet_client(credentials_fingerprint: str) -> t.Tuple['google.auth.credentials.Credentials',
+                                                                  'gspread.Client']:
+    """The credentials from the config and an authorized client, shared by all downloads in this process
+
+    Saves an OAuth token refresh and new TLS connections for each sheet. The fingerprint of the credentials
+    is only the cache key, so that a changed config gets a new client.
+    """
+    from .__main__ import _google_sheet_credentials, _authorized_client
+
+    credentials = _google_sheet_credentials()
+    return credentials, _authorized_client(credentials)
+
+
+def _is_postgresql(db_alias: str) -> bool:
+    """Whether the db is a PostgreSQL db (and not a Redshift db, which mara_db derives from PostgreSQLDB, but which
+    supports no COPY FROM STDIN: mara_db loads it via S3)"""
+    db = mara_db.dbs.db(db_alias)
+    return isinstance(db, mara_db.dbs.PostgreSQLDB) and not isinstance(db, mara_db.dbs.RedshiftDB)
+
+
+def _can_copy_in_process(db_alias: str) -> bool:
+    """Whether the sheet can be copied within the current process (needs psycopg 3 and a PostgreSQL db)"""
+    return _is_postgresql(db_alias) and importlib.util.find_spec('psycopg') is not None
+
+
+def _can_copy_via_psql(db_alias: str) -> bool:
+    """Whether the sheet can be piped from the current process into psql (needs psql and a PostgreSQL db)"""
+    return _is_postgresql(db_alias) and shutil.which('psql') is not None
+
+
+def _psql_command(db: mara_db.dbs.PostgreSQLDB, *statements: str) -> t.List[str]:
+    """The arguments to run statements with psql, like mara_db.shell.query_command() but without a shell
+
+    Several statements are run in one transaction.
+    """
+    command = ['psql', '--no-psqlrc', '--set', 'ON_ERROR_STOP=on', '--quiet']
+    if db.user:
+        command.append(f'--username={db.user}')
+    if db.host:
+        command.append(f'--host={db.host}')
+    if db.port:
+        command.append(f'--port={db.port}')
+    if db.database:
+        command.append(f'--dbname={db.database}')
+    if len(statements) > 1:
+        command.append('--single-transaction')
+    command.extend(f'--command={statement}' for statement in statements)
+    return command
+
+
+def _psql_environment(db: mara_db.dbs.PostgreSQLDB) -> t.Dict[str, str]:
+    """The environment for psql: the password and ssl settings of the db are passed as PG* variables"""
+    import mara_db.config
+
+    environment = dict(os.environ,
+                       PGTZ=mara_db.config.default_timezone(),
+                       PGOPTIONS='--client-min-messages=warning',
+                       # the downloader writes utf-8
+                       PGCLIENTENCODING='UTF8')
+    for name, value in [('PGPASSWORD', db.password), ('PGSSLMODE', db.sslmode),
+                        ('PGSSLROOTCERT', db.sslrootcert), ('PGSSLCERT', db.sslcert), ('PGSSLKEY', db.sslkey)]:
+        if value:
+            environment[name] = str(value)
+    return environment
+
+
+def _postgres_connection(db: mara_db.dbs.PostgreSQLDB) -> 'psycopg.Connection':
+    """Opens a psycopg 3 connection to a PostgreSQL db (commits when the `with` block is left without an error)"""
+    import psycopg
+
+    # None values are left out of the connection string
+    return psycopg.connect(host=db.host, port=db.port, dbname=db.database, user=db.user, password=db.password,
+                           sslmode=db.sslmode, sslrootcert=db.sslrootcert, sslcert=db.sslcert, sslkey=db.sslkey)
+
+
+class _CopyWriter(io.RawIOBase):
+    """A raw binary stream which sends everything written to it into a psycopg COPY (or another binary file)"""
+
+    def __init__(self, copy: t.Union['psycopg.Copy', t.BinaryIO]):
+        self.copy = copy
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.copy.write(bytes(data))
+        return len(data)
+
+
+@contextlib.contextmanager
+def _buffered_copy_stream(copy: 'psycopg.Copy', binary: bool = False,
+                          buffer_size: int = COPY_BUFFER_SIZE) -> t.Iterator[t.Union[t.TextIO, t.BinaryIO]]:
+    """Yields a stream which sends the written rows into the COPY in big blocks instead of one call per row"""
+    from .__main__ import _text_stream
+
+    stream = _text_stream(_CopyWriter(copy), encoding=copy.connection.info.encoding, buffer_size=buffer_size,
+                          binary=binary)
+    yield stream
+    # only on success: the COPY is aborted anyway on an error
+    stream.flush()
+
+
+@functools.lru_cache(maxsize=2)
 def _invocation(use_flask):
     # import mara_google_sheet_downloader
     import mara_google_sheet_downloader.__main__
@@ -124,37 +501,40 @@ def gs_downloader_shell_command(spreadsheet_key: str,
                            not passed in via commandline arguments.
         fail_on_no_data: bool=True, if true fail on no data rows received
     """
-    command = []
-    command.extend([
-        _invocation(use_flask_command),
-        _shell_linebreak_escape,
-        _indentions,
-        f" --spreadsheet-key='{spreadsheet_key}'",
-        f" --worksheet-name='{worksheet_name}'",
-        f" --columns-definition='{columns_definition}'",
-        f' --skip-rows={skip_rows}',
-        f" --delimiter-char='{delimiter_char}'",
-        f' --fail-on-no-data' if fail_on_no_data else f' --no-fail-on-no-data'
-    ])
-    if not use_flask_command:
-        if c.gs_service_account_client_id():
-            command.extend([
-                _shell_linebreak_escape,
-                _indentions,
-                f" --service-account-client-id='{c.gs_service_account_client_id()}'",
-                f" --service-account-private-key-id='{c.gs_service_account_private_key_id()}'",
-                f" --service-account-private-key='{c.gs_service_account_private_key()}'",
-                f" --service-account-client-email='{c.gs_service_account_client_email()}'",
-            ])
-        elif c.gs_user_account_client_id():
-            command.extend([
-                _shell_linebreak_escape,
-                _indentions,
-                f" --user-account-client-id='{c.gs_user_account_client_id()}'",
-                f" --user-account-client-secret='{c.gs_user_account_client_secret()}'",
-                f" --user-account-refresh-token='{c.gs_user_account_refresh_token()}'",
-            ])
-        else:
-            raise RuntimeError("Need either credentials for a google user account or for a google service account")
+    command = (f'{_invocation(use_flask_command)}{_shell_linebreak_escape}{_indentions}'
+               f' --spreadsheet-key={_quote(spreadsheet_key)}'
+               f' --worksheet-name={_quote(worksheet_name)}'
+               f' --columns-definition={_quote(columns_definition)}'
+               f' --skip-rows={skip_rows}'
+               f' --delimiter-char={_quote(delimiter_char)}'
+               f'{" --fail-on-no-data" if fail_on_no_data else " --no-fail-on-no-data"}')
+    # the flask command takes the credentials directly from the config
+    return command if use_flask_command else command + _credentials_arguments()
 
-    return ''.join(command)
+
+def _quote(value: t.Any) -> str:
+    """Quotes a value for the shell, so that e.g. a `'` in a worksheet name doesn't break the command"""
+    quoted = shlex.quote(str(value))
+    # shlex leaves "safe" values unquoted, but quote them anyway so all arguments look the same
+    return quoted if quoted.startswith("'") else f"'{quoted}'"
+
+
+def _credentials_arguments() -> str:
+    """The command line arguments which pass the credentials from the config to the downloader
+
+    Each config function is called only once, as they can do a fresh lookup on each call.
+    """
+    service_account_client_id = c.gs_service_account_client_id()
+    if service_account_client_id:
+        return (f'{_shell_linebreak_escape}{_indentions}'
+                f' --service-account-client-id={_quote(service_account_client_id)}'
+                f' --service-account-private-key-id={_quote(c.gs_service_account_private_key_id())}'
+                f' --service-account-private-key={_quote(c.gs_service_account_private_key())}'
+                f' --service-account-client-email={_quote(c.gs_service_account_client_email())}')
+    user_account_client_id = c.gs_user_account_client_id()
+    if user_account_client_id:
+        return (f'{_shell_linebreak_escape}{_indentions}'
+                f' --user-account-client-id={_quote(user_account_client_id)}'
+                f' --user-account-client-secret={_quote(c.gs_user_account_client_secret())}'
+                f' --user-account-refresh-token={_quote(c.gs_user_account_refresh_token())}')
+    raise RuntimeError("Need either credentials for a google user account or for a google service account")
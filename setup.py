@@ -2,10 +2,14 @@ from setuptools import setup, find_packages
 import re
 
 
+# images in the docs folder, linked with absolute urls on pypi
+_DOCS_IMAGE_RE = re.compile(r'!\[(.*?)\]\(docs/(.*?)\)')
+
+
 def get_long_description():
     with open('README.md') as f:
-        return re.sub('!\[(.*?)\]\(docs/(.*?)\)',
-                      r'![\1](https://github.com/mara/mara-google-sheet-downloader/raw/master/docs/\2)', f.read())
+        return _DOCS_IMAGE_RE.sub(r'![\1](https://github.com/mara/mara-google-sheet-downloader/raw/master/docs/\2)',
+                                  f.read())
 
 
 setup(
@@ -22,10 +26,14 @@ setup(
     install_requires=[
         'mara-db>=4.2.0',
         'mara-pipelines>=3.0.0',
-        'gspread>=3.1.0',
-        'oauth2client>=1.5.0', # old, will be replaced soon
-        'google_auth_oauthlib' # new, already used in the user credential helper
+        'gspread>=5.0.0',
+        'google-auth',
+        'google_auth_oauthlib' # used in the user credential helper
     ],
+    extras_require={
+        # copies the sheets in process into PostgreSQL instead of piping them through psql
+        'psycopg': ['psycopg>=3.0'],
+    },
     tests_require=['pytest'],
 
     python_requires='>=3.6',
@@ -0,0 +1,45 @@
+import pytest
+import requests
+import gspread
+from mara_google_sheet_downloader import __main__ as m
+
+
+def api_error(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = b'{"error": {"code": %d, "message": "mock", "status": "mock"}}' % status_code
+    return gspread.exceptions.APIError(response)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(m.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def failing(*errors):
+    errors = list(errors)
+
+    def f():
+        if errors:
+            raise errors.pop(0)
+        return 'result'
+
+    return f
+
+
+def test_retries_temporary_errors(sleeps):
+    f = failing(api_error(503), api_error(429, {'Retry-After': '7'}), ConnectionError())
+    assert m._call_with_retries(f) == 'result'
+    assert len(sleeps) == 3
+    assert 1 <= sleeps[0] <= 1.5
+    assert sleeps[1] == 7
+
+
+@pytest.mark.parametrize('status_code', [400, 401, 403, 404])
+def test_fails_fast_on_client_errors(sleeps, status_code):
+    with pytest.raises(gspread.exceptions.APIError):
+        m._call_with_retries(failing(api_error(status_code)))
+    assert sleeps == []
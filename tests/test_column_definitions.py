@@ -1,4 +1,6 @@
-from mara_google_sheet_downloader.columns_definition import parse_column_definition, str_, int_, float_
+from mara_google_sheet_downloader.columns_definition import parse_column_definition, str_, int_, float_, counter_, \
+    bool_, date_, add_on_
+import pickle
 import pytest
 
 
@@ -30,16 +32,33 @@ def test_parse_column_definition():
         pass
 
 
+def test_parse_column_definition_cached():
+    first = parse_column_definition('sc(start=3)')
+    first[1](None)
+    second = parse_column_definition('sc(start=3)')
+    # stateless cells are reused, counters start fresh
+    assert first[0] is second[0]
+    assert first[1] is not second[1]
+    assert second == [str_(), counter_(start=3)]
+    assert second[1](None) == '4'
+
+
 def test_string_formatting():
     assert str_()('') == ''
     assert str_()(None) == ''
     assert str_()(' ') == ''
     assert str_()(' a ') == 'a'
+    assert str_()('a\tb') == 'a\tb'
+    with pytest.raises(ValueError):
+        str_(required=True)(' ')
 
 
 def test_numeric_formatting():
     assert float_()(None) == ''
 
+    assert int_()('12345678901234567890') == '12345678901234567890'
+    assert int_()('1e3') == '1000'
+
     assert float_(lower=1, upper=200)('1.23') == '1.23'
     assert float_(lower=1, upper=200)('1.23 ') == '1.23'
     assert float_(lower=1, upper=2000)('123,4') == '1234.0'
@@ -76,8 +95,53 @@ def test_numeric_formatting():
         float_(lower=3)('2.23')
 
 
+def test_bool_formatting():
+    assert bool_()('t') == 'True'
+    assert bool_()('TRUE') == 'True'
+    assert bool_()('0') == 'False'
+    assert bool_()('') == ''
+    assert bool_(true='ja', false='nein')('Ja') == 'True'
+    assert bool_(true='ja', false='nein')('nein') == 'False'
+    assert parse_column_definition('b(true=ja,false=nein)')[0]('JA') == 'True'
+
+    with pytest.raises(ValueError):
+        bool_()('ja')
+
+
+def test_date_formatting():
+    assert date_()('2020-01-31') == '2020-01-31'
+    assert date_()('2020-1-31') == '2020-01-31'
+    assert date_(in_fmt='%d.%m.%Y')('31.01.2020') == '2020-01-31'
+    assert date_(in_fmt='%d.%m.%Y', out_fmt='%Y%m%d')('31.01.2020') == '20200131'
+    assert parse_column_definition('d(in_fmt=%d.%m.%Y)') == [date_(in_fmt='%d.%m.%Y')]
+
+    with pytest.raises(ValueError):
+        date_()('2020-02-30')
+    with pytest.raises(ValueError):
+        date_()('31.01.2020')
+
+    # values are cached, errors are not
+    cell = date_(in_fmt='%d.%m.%Y')
+    for _ in range(2):
+        assert cell('31.01.2020') == '2020-01-31'
+        with pytest.raises(ValueError):
+            cell('31.02.2020')
+    # the cache is not part of the cell, e.g. a pipeline with it can be pickled
+    assert pickle.loads(pickle.dumps(cell))('31.01.2020') == '2020-01-31'
+
+
+def test_formatted_values_are_str():
+    for cell, value in [(str_(), ' a '), (int_(), '1'), (float_(), '1.5'), (bool_(), 'T'),
+                        (date_(), '2020-01-31'), (add_on_(value='a'), None), (counter_(), None)]:
+        assert isinstance(cell.validate_and_format_value(value), str), cell
+
+
 if __name__ == '__main__':
     test_parse_column_definition()
+    test_parse_column_definition_cached()
     test_string_formatting()
     test_numeric_formatting()
+    test_bool_formatting()
+    test_date_formatting()
+    test_formatted_values_are_str()
     print("Done.")
@@ -0,0 +1,62 @@
+import datetime
+import pytest
+from mara_google_sheet_downloader import __main__ as m
+
+
+@pytest.fixture
+def private_key():
+    rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+    from cryptography.hazmat.primitives import serialization
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption()).decode()
+
+
+def service_account_credentials(private_key):
+    return m._google_sheet_credentials_from_service_account_credentials(
+        private_key_id='mock_private_key_id',
+        private_key=private_key,
+        client_email='mock@mock.iam.gserviceaccount.com',
+        client_id='mock_client_id')
+
+
+def test_service_account_token_is_cached(monkeypatch, tmp_path, private_key):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+
+    credentials = service_account_credentials(private_key)
+    assert not credentials.valid
+
+    credentials.token = 'mock_token'
+    credentials.expiry = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(hours=1)
+    m._cache_token(credentials)
+    assert (tmp_path / 'mara_gs_token.json').stat().st_mode & 0o777 == 0o600
+
+    credentials = service_account_credentials(private_key)
+    assert credentials.valid
+    assert credentials.token == 'mock_token'
+
+
+def test_broken_token_cache_is_ignored(monkeypatch, tmp_path, private_key):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    (tmp_path / 'mara_gs_token.json').write_text('{')
+
+    credentials = service_account_credentials(private_key)
+    assert not credentials.valid
+
+
+def test_token_cache_from_threads(monkeypatch, tmp_path):
+    import concurrent.futures
+    import json
+    import types
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    expiry = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(hours=1)
+
+    def cache_token(i):
+        m._cache_token(types.SimpleNamespace(service_account_email=f'mock{i}@mock.iam.gserviceaccount.com',
+                                             token=f'mock_token_{i}', expiry=expiry))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(cache_token, range(50)))
+    # no token is lost and no temporary file is left behind
+    assert len(json.loads((tmp_path / 'mara_gs_token.json').read_text())) == 50
+    assert [path.name for path in tmp_path.iterdir()] == ['mara_gs_token.json']
@@ -0,0 +1,67 @@
+import io
+from mara_google_sheet_downloader import __main__ as m
+from .test_iter_worksheet_rows import FakeWorksheet
+
+
+class FakeClient:
+    def __init__(self, spreadsheets):
+        self.spreadsheets = spreadsheets
+
+    def open_by_key(self, key):
+        return self.spreadsheets[key]
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets):
+        self._worksheets = worksheets
+        for title, worksheet in worksheets.items():
+            worksheet.title = title
+        self.batch_requests = []
+
+    def worksheet(self, title):
+        return self._worksheets[title]
+
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+    def values_batch_get(self, ranges):
+        self.batch_requests.append(ranges)
+        value_ranges = []
+        for range_name in ranges:
+            title, range_name = range_name.rsplit('!', 1)
+            values = self._worksheets[title[1:-1].replace("''", "'")].get_values(range_name)
+            # like google: no values for an empty range
+            value_ranges.append({'range': range_name, 'values': values} if values else {'range': range_name})
+        return {'valueRanges': value_ranges}
+
+
+def test_download_many(monkeypatch):
+    spreadsheet = FakeSpreadsheet({'ws1': FakeWorksheet([['h1', 'h2'], ['a', '1']], row_count=10, col_count=2),
+                                   "Tom's": FakeWorksheet([['h1', 'h2'], ['b', '2'], ['c', '3']], row_count=10,
+                                                          col_count=2)})
+    client = FakeClient({
+        'key1': spreadsheet,
+        'key2': FakeSpreadsheet({'ws1': FakeWorksheet([['h1', 'h2']], row_count=10, col_count=2)}),
+    })
+    monkeypatch.setattr(m, '_authorized_client', lambda credentials: client)
+
+    streams = [io.StringIO(), io.StringIO(), io.StringIO()]
+    nrows = m.download_many([('key1', 'ws1', 'si', streams[0]),
+                             ('key1', "Tom's", 'cs', streams[1]),
+                             ('key2', 'ws1', 'si', streams[2])],
+                            credentials=object(), delimiter_char=';')
+    assert nrows == [1, 2, 0]
+    assert [stream.getvalue() for stream in streams] == ['a;1\r\n', '1;b\r\n2;c\r\n', '']
+    # the first (here: only) windows of both sheets of a spreadsheet are fetched in one request
+    assert spreadsheet.batch_requests == [["'ws1'!A1:B10", "'Tom''s'!A1:A10"]]
+
+
+def test_download_many_empty_worksheet(monkeypatch):
+    spreadsheet = FakeSpreadsheet({'ws1': FakeWorksheet([], row_count=10, col_count=2)})
+    monkeypatch.setattr(m, '_authorized_client', lambda credentials: FakeClient({'key1': spreadsheet}))
+
+    stream = io.StringIO()
+    # like a single download of the sheet: no rows instead of missing header rows
+    assert m.download_many([('key1', 'ws1', 'si', stream)], credentials=object()) == [0]
+    assert stream.getvalue() == ''
+    assert spreadsheet.batch_requests == [["'ws1'!A1:B10"]]
@@ -0,0 +1,68 @@
+import pytest
+import threading
+from mara_google_sheet_downloader.__main__ import _iter_worksheet_rows
+
+
+class FakeWorksheet:
+    """Answers range requests like the Sheets API: trailing empty rows are omitted"""
+
+    def __init__(self, rows, row_count, col_count=3):
+        self.rows = rows
+        self.row_count = row_count
+        self.col_count = col_count
+        self.requested_ranges = []
+
+    def get_values(self, range_name):
+        self.requested_ranges.append(range_name)
+        first, last = range_name.split(':')
+        first_row, last_row = int(first[1:]), int(last[1:])
+        last_col = ord(last[0]) - ord('A') + 1
+        rows = [row[:last_col] for row in self.rows[first_row - 1:last_row]]
+        # trailing empty values are omitted
+        return [row[:max([i + 1 for i, value in enumerate(row) if value] or [0])] for row in rows]
+
+
+def test_paginated_rows():
+    rows = [['h1', 'h2', 'h3']] + [[str(i), 'b', 'c'] for i in range(10)]
+    worksheet = FakeWorksheet(rows, row_count=20)
+    assert list(_iter_worksheet_rows(worksheet, skip_rows=1, rows_per_request=4)) == rows[1:]
+    assert worksheet.requested_ranges == ['A1:C5', 'A6:C9', 'A10:C13', 'A14:C17', 'A18:C20']
+
+
+def test_requested_columns():
+    rows = [['h1', 'h2', 'h3', 'h4'], ['a', 'b', '', 'd'], ['a', '', '', '']]
+    worksheet = FakeWorksheet(rows, row_count=100, col_count=4)
+    assert list(_iter_worksheet_rows(worksheet, skip_rows=1, number_of_columns=3)) == [['a', 'b', ''],
+                                                                                        ['a', '', '']]
+    assert worksheet.requested_ranges == ['A1:C100']
+    # columns beyond the grid are not requested, but are empty
+    worksheet = FakeWorksheet(rows, row_count=100, col_count=4)
+    assert list(_iter_worksheet_rows(worksheet, skip_rows=1, number_of_columns=5)) == [['a', 'b', '', 'd', ''],
+                                                                                        ['a', '', '', '', '']]
+    assert worksheet.requested_ranges == ['A1:D100']
+
+
+def test_missing_header_rows():
+    worksheet = FakeWorksheet([['h1', 'h2', 'h3']], row_count=1000)
+    with pytest.raises(ValueError, match='header rows'):
+        list(_iter_worksheet_rows(worksheet, skip_rows=2))
+
+
+def test_next_window_is_prefetched():
+    rows = [['h1', 'h2', 'h3']] + [[str(i), 'b', 'c'] for i in range(10)]
+    worksheet = FakeWorksheet(rows, row_count=20)
+    requested = threading.Event()
+    get_values = worksheet.get_values
+
+    def get_values_and_notify(range_name):
+        values = get_values(range_name)
+        if range_name == 'A6:C9':
+            requested.set()
+        return values
+
+    worksheet.get_values = get_values_and_notify
+    iterator = _iter_worksheet_rows(worksheet, skip_rows=1, rows_per_request=4)
+    assert next(iterator) == rows[1]
+    # the second window is requested before the first one is consumed
+    assert requested.wait(timeout=5)
+    iterator.close()
@@ -1,5 +1,6 @@
 from mara_google_sheet_downloader import mara_integration as mi
 import pytest
+import shlex
 
 
 @pytest.fixture
@@ -78,3 +79,217 @@ def test_DownloadGoogleSpreadsheet_command_with_python_without_credentials(mock_
     with pytest.raises(RuntimeError, match='credentials'):
         # missing credentials
         command.shell_command()
+
+
+def test_gs_downloader_shell_command_quotes_values():
+    shell_command = mi.gs_downloader_shell_command(spreadsheet_key, "Tom's sheet", columns_definition,
+                                                   use_flask_command=True)
+    assert "--worksheet-name='Tom'\"'\"'s sheet'" in shell_command
+    assert "--worksheet-name=Tom's sheet" in shlex.split(shell_command)
+
+
+class _FakeDownload(mi.DownloadGoogleSpreadsheet):
+    def __init__(self, result):
+        super().__init__(spreadsheet_key, worksheet_name, columns_definition, target_table_name)
+        self.result = result
+        self.was_run = False
+
+    def run(self) -> bool:
+        self.was_run = True
+        return self.result
+
+
+def test_DownloadGoogleSpreadsheets_runs_all_sheets():
+    sheets = [_FakeDownload(True) for _ in range(5)]
+    assert mi.DownloadGoogleSpreadsheets(sheets, max_workers=2).run()
+    assert all(sheet.was_run for sheet in sheets)
+
+
+def test_DownloadGoogleSpreadsheets_fails_on_first_failure():
+    sheets = [_FakeDownload(True), _FakeDownload(False), _FakeDownload(True)]
+    assert not mi.DownloadGoogleSpreadsheets(sheets, max_workers=1).run()
+
+
+class _FakeCopy:
+    class connection:
+        class info:
+            encoding = 'utf-8'
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+def test_buffered_copy_stream():
+    copy = _FakeCopy()
+    with mi._buffered_copy_stream(copy) as stream:
+        for i in range(1000):
+            stream.write(f'{i}\tä\n')
+    # all rows are sent in one block
+    assert copy.writes == [''.join(f'{i}\tä\n' for i in range(1000)).encode()]
+
+
+@pytest.fixture
+def mock_databases(monkeypatch):
+    """A PostgreSQL, a Redshift and a SQL Server db"""
+    import mara_db.dbs
+    import mara_db.config
+
+    monkeypatch.setattr(mara_db.config, 'databases', lambda: {
+        'dwh': mara_db.dbs.PostgreSQLDB(host='localhost', database='mock_db'),
+        'redshift': mara_db.dbs.RedshiftDB(host='localhost', database='mock_db', aws_s3_bucket_name='mock_bucket'),
+        'mssql': mara_db.dbs.SQLServerDB(host='localhost', database='mock_db')})
+
+
+@pytest.mark.parametrize('db_alias, psycopg, psql, copy_format, path', [
+    ('dwh', True, True, 'csv', 'psycopg'),
+    ('dwh', True, False, 'binary', 'psycopg'),
+    ('dwh', False, True, 'binary', 'psql'),
+    ('dwh', False, False, 'csv', 'shell'),
+    ('dwh', False, False, 'binary', None),
+    # mara_db loads Redshift via S3, there is no COPY FROM STDIN
+    ('redshift', True, False, 'csv', 'shell'),
+    ('redshift', False, True, 'csv', 'shell'),
+    ('redshift', True, True, 'binary', None),
+    ('mssql', True, True, 'csv', 'shell'),
+])
+def test_DownloadGoogleSpreadsheet_run_routing(monkeypatch, mock_databases, db_alias, psycopg, psql, copy_format,
+                                               path):
+    import mara_pipelines.pipelines
+    monkeypatch.setattr(mi.importlib.util, 'find_spec', lambda name: object() if psycopg else None)
+    monkeypatch.setattr(mi.shutil, 'which', lambda name: '/usr/bin/psql' if psql else None)
+    paths = []
+    monkeypatch.setattr(mi.DownloadGoogleSpreadsheet, '_copy_in_process', lambda self: paths.append('psycopg') or True)
+    monkeypatch.setattr(mi.DownloadGoogleSpreadsheet, '_copy_via_psql', lambda self: paths.append('psql') or True)
+    monkeypatch.setattr(mara_pipelines.pipelines.Command, 'run', lambda self: paths.append('shell') or True)
+
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name=worksheet_name,
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name,
+                                           target_db_alias=db_alias,
+                                           copy_format=copy_format)
+    assert command.run() == (path is not None)
+    assert paths == ([path] if path else [])
+    # the docs show how the sheet is actually loaded
+    assert {'psycopg': 'psycopg', 'psql': 'psql'}.get(path, 'mara_google_sheet_downloader') in command._loading_path()
+
+
+def test_DownloadGoogleSpreadsheet_truncate_before_load_on_redshift(monkeypatch, mock_databases):
+    import mara_pipelines.pipelines
+    monkeypatch.setattr(mara_pipelines.pipelines.Command, 'run', lambda self: pytest.fail('runs the shell command'))
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name=worksheet_name,
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name,
+                                           target_db_alias='redshift',
+                                           use_flask_command=True,
+                                           truncate_before_load=True)
+    # fails like any other load instead of raising
+    assert command.run() is False
+    with pytest.raises(ValueError, match='PostgreSQL'):
+        command.shell_command()
+
+
+def test_copy_via_psql_doesnt_truncate_without_rows(monkeypatch, mock_databases):
+    monkeypatch.setattr(mi, '_google_sheet_client', lambda fingerprint: (object(), object()))
+    monkeypatch.setattr(mi, '_credentials_fingerprint', lambda: 'mock_fingerprint')
+    monkeypatch.setattr(mi.subprocess, 'Popen', lambda *args, **kwargs: pytest.fail('starts psql'))
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name=worksheet_name,
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name,
+                                           fail_on_no_data=True,
+                                           truncate_before_load=True)
+    monkeypatch.setattr(command, '_download_to_stream', lambda client, stream: 0)
+    assert command._copy_via_psql() is False
+
+
+def test_copy_statement():
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name=worksheet_name,
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name)
+    assert command._copy_statement() == \
+        f"COPY {target_table_name} FROM STDIN WITH (FORMAT csv, DELIMITER '\t', NULL '')"
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name=worksheet_name,
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name,
+                                           copy_format='binary',
+                                           truncate_before_load=True)
+    assert command._copy_statement() == f"COPY {target_table_name} FROM STDIN WITH (FORMAT binary, FREEZE)"
+    assert command._truncate_statement() == f"TRUNCATE {target_table_name}"
+
+
+def test_psql_command():
+    import mara_db.dbs
+    db = mara_db.dbs.PostgreSQLDB(host='localhost', port=5433, database='mock_db', user='me', password="it's secret")
+    assert mi._psql_command(db, 'COPY t FROM STDIN') == [
+        'psql', '--no-psqlrc', '--set', 'ON_ERROR_STOP=on', '--quiet', '--username=me', '--host=localhost',
+        '--port=5433', '--dbname=mock_db', '--command=COPY t FROM STDIN']
+    # the password is not visible in the process list
+    assert mi._psql_environment(db)['PGPASSWORD'] == "it's secret"
+    # truncate and copy in one transaction
+    assert mi._psql_command(db, 'TRUNCATE t', 'COPY t FROM STDIN WITH (FREEZE)')[-3:] == [
+        '--single-transaction', '--command=TRUNCATE t', '--command=COPY t FROM STDIN WITH (FREEZE)']
+
+
+def test_DownloadGoogleSpreadsheet_truncate_before_load(mock_mara_pipelines_config):
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name=worksheet_name,
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name,
+                                           use_flask_command=True,
+                                           truncate_before_load=True)
+    shell_command = command.shell_command()
+    assert '--single-transaction' in shell_command
+    assert f"--command='TRUNCATE {target_table_name}'" in shell_command
+    assert 'FREEZE' in command._copy_statement()
+
+
+def test_DownloadGoogleSpreadsheet_download_to_temporary_file(monkeypatch):
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name=worksheet_name,
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name,
+                                           truncate_before_load=True)
+
+    def download_to_stream(client, stream):
+        for i in range(1000):
+            stream.write(f'{i}\tä\n')
+        return 1000
+
+    monkeypatch.setattr(command, '_download_to_stream', download_to_stream)
+    # the whole sheet is downloaded before the table is truncated
+    with command._download_to_temporary_file(client=None, encoding='utf-8') as (nrows, rows):
+        assert nrows == 1000
+        assert rows.read() == ''.join(f'{i}\tä\n' for i in range(1000)).encode()
+
+
+def test_google_sheet_client_is_shared(monkeypatch, mock_mara_google_sheet_downloader_config):
+    import mara_google_sheet_downloader.__main__ as m
+    import mara_google_sheet_downloader.config
+    monkeypatch.setattr(m, '_google_sheet_credentials', lambda: object())
+    monkeypatch.setattr(m, '_authorized_client', lambda credentials: object())
+    mi._google_sheet_client.cache_clear()
+
+    first = mi._google_sheet_client(mi._credentials_fingerprint())
+    assert mi._google_sheet_client(mi._credentials_fingerprint()) is first
+    # other credentials, other client
+    monkeypatch.setattr(mara_google_sheet_downloader.config, 'gs_user_account_refresh_token', lambda: 'other')
+    assert mi._google_sheet_client(mi._credentials_fingerprint()) is not first
+    mi._google_sheet_client.cache_clear()
+
+
+def test_html_doc_items_are_cached(mock_mara_pipelines_config):
+    command = mi.DownloadGoogleSpreadsheet(spreadsheet_key=spreadsheet_key,
+                                           worksheet_name='<yyy>',
+                                           columns_definition=columns_definition,
+                                           target_table_name=target_table_name)
+    items = command.html_doc_items()
+    assert ('worksheet name', '<pre>&lt;yyy&gt;</pre>') in [(name, str(value)) for name, value in items]
+    assert command.html_doc_items() == items
+    assert command.html_doc_items()[0][1] is items[0][1]
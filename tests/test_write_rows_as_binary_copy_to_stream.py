@@ -0,0 +1,41 @@
+import pytest
+import io
+import struct
+import datetime
+from mara_google_sheet_downloader.columns_definition import write_rows_as_binary_copy_to_stream
+
+HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+TRAILER = struct.pack('>h', -1)
+
+
+def test_happy_case():
+    rows = [['a', '1,000', '1,5', 'f', '2020-02-01'], ['', '', '', '', '']]
+    stream = io.BytesIO()
+    nrows = write_rows_as_binary_copy_to_stream(rows, columns_definition='c(start=5)sifbd&(value=z)', stream=stream)
+    assert nrows == 1
+    expected = (HEADER
+                + struct.pack('>h', 7)
+                + struct.pack('>iq', 8, 6)
+                + struct.pack('>i', 1) + b'a'
+                + struct.pack('>iq', 8, 1000)
+                + struct.pack('>id', 8, 15.0)
+                + struct.pack('>i?', 1, False)
+                + struct.pack('>ii', 4, (datetime.date(2020, 2, 1) - datetime.date(2000, 1, 1)).days)
+                + struct.pack('>i', 1) + b'z'
+                + TRAILER)
+    assert stream.getvalue() == expected
+
+
+def test_empty_values_are_null():
+    stream = io.BytesIO()
+    nrows = write_rows_as_binary_copy_to_stream([['', 'x', '', '']], columns_definition='ixbd', stream=stream)
+    assert nrows == 1
+    assert stream.getvalue() == HEADER + struct.pack('>h', 3) + struct.pack('>i', -1) * 3 + TRAILER
+
+
+def test_bad_data():
+    stream = io.BytesIO()
+    with pytest.raises(ValueError, match='Row contains bad data'):
+        write_rows_as_binary_copy_to_stream([['1', 'x']], columns_definition='ii', stream=stream)
+    with pytest.raises(ValueError, match='Row contains bad data'):
+        write_rows_as_binary_copy_to_stream([['1', '']], columns_definition='ii!', stream=stream)
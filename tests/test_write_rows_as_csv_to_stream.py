@@ -9,3 +9,18 @@ def test_happy_case():
     assert nrows == 2
     actual = stream.getvalue().replace('\r\n', '\n')
     assert actual == '1.0\t2.0\t3.0\n1.0\t20.0\t3.0\n'
+
+
+def test_add_on_counter_and_dropped_columns():
+    rows = [['a', 'dropped', '1'], ['', '', ''], ['b', 'dropped', '2']]
+    stream = io.StringIO()
+    nrows = write_rows_as_csv_to_stream(rows, columns_definition='c(start=5)sx&(value=z)i!', stream=stream)
+    assert nrows == 2
+    actual = stream.getvalue().replace('\r\n', '\n')
+    assert actual == '6\ta\tz\t1\n7\tb\tz\t2\n'
+
+
+def test_bad_data():
+    stream = io.StringIO()
+    with pytest.raises(ValueError, match='Row contains bad data'):
+        write_rows_as_csv_to_stream([['1', 'x']], columns_definition='ii', stream=stream)